@@ -1,25 +1,53 @@
 """FastAPI application exposing YOLO11m detections with API key auth."""
 from __future__ import annotations
 
-import base64
+import asyncio
+import binascii
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import functools
 import logging
 from logging.handlers import RotatingFileHandler
 import os
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+import queue
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
 
 import cv2
 import numpy as np
 from dotenv import load_dotenv
-from fastapi import Depends, FastAPI, File, HTTPException, Request, UploadFile, status
+from fastapi import (
+    BackgroundTasks,
+    Depends,
+    FastAPI,
+    File,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+    status,
+)
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
-from PIL import Image
 
+from src.annotation_store import AnnotationStore
 from src.auth import build_api_key_dependency
-from src.image_utils import draw_detections, encode_image_to_data_uri, load_image_from_bytes
-from src.model import get_or_load_model, load_model
+from src.batcher import MicroBatcher
+from src.image_utils import (
+    BytesLike,
+    b64decode,
+    build_class_colors,
+    draw_detections_inplace,
+    encode_image_to_data_uri,
+    encode_image_to_jpeg,
+    letterbox_image,
+    load_image_from_bytes,
+    unletterbox_boxes,
+)
+from src.middleware import PAYLOAD_TOO_LARGE_DETAIL, BodySizeLimitMiddleware
+from src.model import load_model, predict_options, resolve_precision
+from src.responses import ORJSONResponse
 
 # `.env` を最優先で読み取ってからシステム環境変数を参照する
 load_dotenv()
@@ -34,10 +62,40 @@ CONF_THRESHOLD = float(os.getenv("YOLO_CONF_THRESHOLD", "0.25"))
 IOU_THRESHOLD = float(os.getenv("YOLO_IOU_THRESHOLD", "0.45"))
 MAX_IMAGE_EDGE = int(os.getenv("YOLO_MAX_IMAGE_EDGE", "2048"))
 MAX_IMAGE_PIXELS = int(os.getenv("YOLO_MAX_IMAGE_PIXELS", "4000000"))
+# デコードを許可する最大画素数（ヘッダーで判定、超えると 413）。既定は従来の PIL の上限と同じ約 179 Mpx
+MAX_DECODE_PIXELS = int(os.getenv("YOLO_MAX_DECODE_PIXELS", "178956970"))
+# モデル入力は常にこの正方形サイズへレターボックスする（TensorRT 静的エンジン / CUDA Graph 向け）
+IMGSZ = int(os.getenv("YOLO_IMGSZ", "640"))
+JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", "82"))
+# リクエスト本文（multipart / JSON）の上限バイト数。0 以下で無制限
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# 推論・デコード・エンコードを流すスレッド数（GPU の同時実行数に合わせて調整）
+EXECUTOR_WORKERS = int(os.getenv("YOLO_EXECUTOR_WORKERS", "4"))
+# 同時リクエストを束ねるマイクロバッチの設定
+MAX_BATCH_SIZE = int(os.getenv("YOLO_MAX_BATCH_SIZE", "8"))
+MAX_BATCH_WAIT_MS = float(os.getenv("YOLO_MAX_BATCH_WAIT_MS", "10"))
+BATCH_QUEUE_SIZE = int(os.getenv("YOLO_BATCH_QUEUE_SIZE", "64"))
+# /detect_batch 1 リクエストあたりの画像枚数上限（キューに一度に積めるよう YOLO_BATCH_QUEUE_SIZE 以下に丸める）
+MAX_BATCH_IMAGES = int(os.getenv("YOLO_MAX_BATCH_IMAGES", "32"))
+if BATCH_QUEUE_SIZE > 0:
+    MAX_BATCH_IMAGES = min(MAX_BATCH_IMAGES, BATCH_QUEUE_SIZE)
+# 1 ワーカー内で同時に走らせる推論の数（スロットごとにモデルを 1 つロード）。
+# ワーカーごとの値なので、GPU 上の同時推論数・モデル数は WEB_CONCURRENCY × この値になる
+GPU_CONCURRENCY = max(1, int(os.getenv("YOLO_GPU_CONCURRENCY", "1")))
+
+# wait_annotate=false のときに後から描画した可視化画像の保存先
+ANNOTATION_DIR = APP_DIR / "annotations"
+ANNOTATION_CACHE_SIZE = int(os.getenv("YOLO_ANNOTATION_CACHE_SIZE", "256"))
 
 LOG_DIR = APP_DIR / "logs"
 LOG_DIR.mkdir(parents=True, exist_ok=True)
-LOG_FILE = LOG_DIR / "server.log"
+# 複数ワーカーが同じファイルをローテーションすると行が失われるため、ワーカーごとに PID 付きのファイルへ書く
+# （uvicorn と同じく WEB_CONCURRENCY でワーカー数を判定）
+if int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+    LOG_FILE = LOG_DIR / f"server.{os.getpid()}.log"
+else:
+    LOG_FILE = LOG_DIR / "server.log"
 
 
 def configure_logger() -> logging.Logger:
@@ -71,15 +129,27 @@ def configure_logger() -> logging.Logger:
 # ベースとなる logger を確保
 logger = configure_logger()
 
+# 推論精度: fp32（既定）/ fp16（CUDA GPU）/ int8（CPU, OpenVINO へ初回エクスポート）
+PRECISION = resolve_precision(os.getenv("YOLO_PRECISION", "fp32"))
+PREDICT_OPTIONS = predict_options(PRECISION)
+INT8_CALIBRATION_DATA = os.getenv("YOLO_INT8_DATA", "coco8.yaml")
+# 1 にすると CUDA が使える場合に初回起動時に TensorRT エンジンへエクスポートして使う（既定は無効）
+USE_TENSORRT = os.getenv("YOLO_TENSORRT", "0").lower() in ("1", "true", "yes")
+
+T = TypeVar("T")
+
 
-def _choose_resample() -> int:
-    return Image.Resampling.LANCZOS if hasattr(Image, "Resampling") else Image.LANCZOS
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """GIL を解放する重い処理（推論・cv2）をスレッドで実行し、イベントループを塞がない。"""
 
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
 
-def prepare_image_for_inference(image: Image.Image) -> Tuple[Image.Image, Dict[str, Any]]:
-    """Resize the image if it is too large for inference."""
 
-    width, height = image.size
+def prepare_image_for_inference(image: np.ndarray) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Downscale the BGR image with OpenCV if it is too large for inference."""
+
+    height, width = image.shape[:2]
     scale = 1.0
     trigger = None
     max_edge = max(width, height)
@@ -97,7 +167,8 @@ def prepare_image_for_inference(image: Image.Image) -> Tuple[Image.Image, Dict[s
 
     if scale < 1.0:
         new_size = (max(1, int(width * scale)), max(1, int(height * scale)))
-        resized = image.resize(new_size, resample=_choose_resample())
+        # 縮小専用なので SIMD 最適化された INTER_AREA を使う（LANCZOS より高速で画質も同等以上）
+        resized = cv2.resize(image, new_size, interpolation=cv2.INTER_AREA)
         return resized, {
             "scaled": True,
             "scale": scale,
@@ -115,23 +186,23 @@ def prepare_image_for_inference(image: Image.Image) -> Tuple[Image.Image, Dict[s
     }
 
 
-def log_response_summary(source: str, response: "DetectionResponse") -> None:
+def log_response_summary(source: str, response: Dict[str, Any]) -> None:
     """Log a concise summary of what will be returned to the client."""
 
     detections_preview = [
         {
-            "label": det.label,
-            "confidence": round(det.confidence, 3),
-            "box": [round(v, 2) for v in det.box],
+            "label": det["label"],
+            "confidence": round(det["confidence"], 3),
+            "box": [round(v, 2) for v in det["box"]],
         }
-        for det in response.detections[:3]
+        for det in response["detections"][:3]
     ]
     logger.info(
         "Responding source=%s detections=%d counts=%s annotated_image_bytes=%d preview=%s",
         source,
-        len(response.detections),
-        response.counts,
-        len(response.image_with_boxes or ""),
+        len(response["detections"]),
+        response["counts"],
+        len(response["image_with_boxes"] or ""),
         detections_preview,
     )
 
@@ -140,8 +211,13 @@ app = FastAPI(
     title="YOLO11m FastAPI Detection API",
     description="Upload an image, authenticate via API key, and receive YOLO detections plus an annotated image.",
     version="0.1.0",
+    # 全エンドポイントの JSON を orjson（C 実装）でシリアライズする
+    default_response_class=ORJSONResponse,
 )
 
+# CORS ヘッダーを 413 応答にも付けるため、サイズ制限は CORS より内側に置く
+app.add_middleware(BodySizeLimitMiddleware, max_body_size=MAX_UPLOAD_BYTES)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # 必要に応じて特定オリジンへ絞り込む
@@ -153,6 +229,9 @@ app.add_middleware(
 # APIキー認証の依存関数をここで組み立てて再利用
 require_api_key = build_api_key_dependency(DEFAULT_API_KEY)
 
+# 後追いで描画した可視化画像はディスクに置き、複数ワーカーから同じ ID で取得できるようにする
+annotation_store = AnnotationStore(ANNOTATION_DIR, max_entries=ANNOTATION_CACHE_SIZE)
+
 
 class Detection(BaseModel):
     """単一検出の構造（APIレスポンス用）。"""
@@ -167,7 +246,14 @@ class DetectionResponse(BaseModel):
 
     detections: List[Detection]
     counts: Dict[str, int]
-    image_with_boxes: str = Field(..., description="Annotated image as Base64 data URI")
+    image_with_boxes: str = Field(
+        ...,
+        description="Annotated image as Base64 data URI (empty when annotate=false or wait_annotate=false)",
+    )
+    annotation_id: Optional[str] = Field(
+        None,
+        description="When wait_annotate=false, fetch the annotated JPEG later from GET /detect/{annotation_id}/annotated",
+    )
 
 
 class ImagePayload(BaseModel):
@@ -179,34 +265,279 @@ class DetectionRequest(BaseModel):
     images: List[ImagePayload]
 
 
+def decode_image_payload(image: ImagePayload) -> bytes:
+    """JSON の Base64 画像（Data URI 可）をバイト列へ戻す。"""
+
+    # Data URI ヘッダーは先頭付近にしかないので、split で全体を複製せず memoryview で読み飛ばす
+    raw = image.base64
+    comma = raw.find(",", 0, 128)
+    try:
+        encoded = raw.encode("ascii")
+        base64_data = memoryview(encoded)[comma + 1 :] if comma >= 0 else encoded
+        return b64decode(base64_data)
+    except (binascii.Error, ValueError) as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid base64 payload") from exc
+
+
+async def read_upload(file: UploadFile) -> bytearray:
+    """アップロードを 64 KiB ずつ読み、MAX_UPLOAD_BYTES を超えた時点で 413 を返す。
+
+    本文サイズは BodySizeLimitMiddleware が先に制限しており、エンドポイント実行時には Starlette が
+    パートを受信し終えている。ここでの上限チェックはメモリ節約ではなく、ミドルウェアが無効・設定漏れの
+    場合の保険。
+    """
+
+    buffer = bytearray()
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        buffer += chunk
+        if 0 < MAX_UPLOAD_BYTES < len(buffer):
+            raise HTTPException(status_code=status.HTTP_413_CONTENT_TOO_LARGE, detail=PAYLOAD_TOO_LARGE_DETAIL)
+    return buffer
+
+
+def load_image_for_inference(contents: BytesLike, source: str) -> Tuple[np.ndarray, np.ndarray, Dict[str, Any]]:
+    """バイト列を BGR 画像へデコードし、推論用サイズへ縮小する。
+
+    戻り値は (描画・座標の基準となる画像, レターボックス済みのモデル入力, 変換情報)。
+    """
+
+    image_bgr = load_image_from_bytes(contents, max_pixels=MAX_DECODE_PIXELS)
+    height, width = image_bgr.shape[:2]
+    byte_length = len(contents)
+    logger.info(
+        "Received image source=%s size=%d bytes (~%.1f KB) resolution=%dx%d px",
+        source,
+        byte_length,
+        byte_length / 1024,
+        width,
+        height,
+    )
+    image_bgr, resize_info = prepare_image_for_inference(image_bgr)
+    final_width, final_height = resize_info["final_size"]
+    if resize_info["scaled"]:
+        logger.info(
+            "Prepared image for YOLO source=%s resolution=%dx%d px (original=%dx%d px, scale=%.3f, trigger=%s)",
+            source,
+            final_width,
+            final_height,
+            resize_info["original_size"][0],
+            resize_info["original_size"][1],
+            resize_info["scale"],
+            resize_info["trigger"],
+        )
+    else:
+        logger.info(
+            "Prepared image for YOLO source=%s resolution=%dx%d px (no resize)",
+            source,
+            final_width,
+            final_height,
+        )
+    model_input, letterbox_info = letterbox_image(image_bgr, IMGSZ)
+    resize_info.update(letterbox_info)
+    return image_bgr, model_input, resize_info
+
+
+def load_payload_for_inference(image: ImagePayload, source: str) -> Tuple[np.ndarray, np.ndarray, Dict[str, Any]]:
+    """JSON の Base64 画像をデコードから推論用の前処理まで一括で行う（executor 上で呼ぶ）。"""
+
+    return load_image_for_inference(decode_image_payload(image), source)
+
+
+def build_detection_response(
+    result: Any,
+    image_bgr: np.ndarray,
+    resize_info: Dict[str, Any],
+    annotate: bool = True,
+) -> Tuple[Dict[str, Any], np.ndarray]:
+    """YOLO の出力（Boxes）を DetectionResponse と同じ形の dict へマッピングし、必要なら可視化画像を添える。
+
+    Pydantic モデルを経由すると構築時とシリアライズ時で二重に検証が走るため、素の dict を返す。
+    後から描画する場合に備えて、検出ごとのクラス ID 配列も一緒に返す。
+    """
+
+    # ボックスごとの属性アクセス（GPU→CPU 同期）を避け、テンソル単位で一度だけ NumPy へ転送する
+    boxes = result.boxes
+    xyxy = boxes.xyxy.cpu().numpy()
+    confs = boxes.conf.cpu().numpy()
+    cls_ids = boxes.cls.cpu().numpy().astype(np.int32)
+
+    # レターボックス座標 → image_bgr 座標へ戻す
+    xyxy = unletterbox_boxes(xyxy, resize_info, image_bgr.shape)
+
+    # tolist() で Python の int/float へ一括変換し、クラス名の辞書はループ外で一度だけ取得する
+    names = result.names
+    labels = [names.get(cls_id, str(cls_id)) for cls_id in cls_ids.tolist()]
+    detections: List[Dict[str, Any]] = [
+        {"label": label, "confidence": conf, "box": box}
+        for label, conf, box in zip(labels, confs.tolist(), xyxy.tolist())
+    ]
+    counts: Dict[str, int] = dict(Counter(labels))
+
+    # 検出結果だけが欲しい場合は描画・JPEG エンコード・Base64 化をまるごと省く
+    image_with_boxes = ""
+    if annotate:
+        # image_bgr はこのリクエスト専用の配列なので、コピーせずそのまま描き込む
+        draw_detections_inplace(image_bgr, detections, cls_ids, app.state.class_colors)
+        image_with_boxes = encode_image_to_data_uri(image_bgr, quality=JPEG_QUALITY)
+    response = {
+        "detections": detections,
+        "counts": counts,
+        "image_with_boxes": image_with_boxes,
+        "annotation_id": None,
+    }
+    return response, cls_ids
+
+
+def render_and_store_annotation(
+    image_bgr: np.ndarray,
+    detections: List[Dict[str, Any]],
+    cls_ids: np.ndarray,
+    annotation_id: str,
+) -> None:
+    """レスポンス返却後に可視化画像を描画し、JPEG として AnnotationStore へ保存する。"""
+
+    try:
+        draw_detections_inplace(image_bgr, detections, cls_ids, app.state.class_colors)
+        annotation_store.save(annotation_id, encode_image_to_jpeg(image_bgr, quality=JPEG_QUALITY))
+    except Exception:  # broad: バックグラウンド処理の失敗はログに残し、取得側へ 410 で伝える
+        logger.exception("Failed to render annotated image annotation_id=%s", annotation_id)
+        annotation_store.mark_failed(annotation_id)
+
+
+def defer_annotation(
+    response: Dict[str, Any],
+    image_bgr: np.ndarray,
+    cls_ids: np.ndarray,
+    background_tasks: BackgroundTasks,
+) -> None:
+    """可視化画像の描画・エンコードをレスポンス送信後のバックグラウンドタスクへ回す。"""
+
+    annotation_id = annotation_store.new_id()
+    annotation_store.mark_pending(annotation_id)
+    response["annotation_id"] = annotation_id
+    background_tasks.add_task(render_and_store_annotation, image_bgr, response["detections"], cls_ids, annotation_id)
+
+
+def model_load_options() -> Dict[str, Any]:
+    """`load_model` に渡す精度・エクスポート関連の設定。"""
+
+    return {
+        "precision": PRECISION,
+        "calibration_data": INT8_CALIBRATION_DATA,
+        "tensorrt": USE_TENSORRT,
+        "imgsz": IMGSZ,
+        "batch": MAX_BATCH_SIZE,
+    }
+
+
+def predict_batch(images: List[np.ndarray]) -> List[Any]:
+    """複数画像を 1 回の `model.predict` で推論する（MicroBatcher から呼ばれる）。"""
+
+    # Ultralytics の predictor はスレッドセーフではないため、同時実行スロットごとに別インスタンスを使う
+    model = app.state.model_pool.get()
+    try:
+        return model.predict(
+            source=images,
+            conf=CONF_THRESHOLD,
+            iou=IOU_THRESHOLD,
+            imgsz=IMGSZ,
+            verbose=False,
+            **PREDICT_OPTIONS,
+        )
+    finally:
+        app.state.model_pool.put(model)
+
+
 @app.on_event("startup")
 def _startup() -> None:
-    """FastAPI 起動時に一度だけモデルをロードし、app.state にキャッシュする。"""
+    """FastAPI 起動時に推論スロット数ぶんのモデルをロードし、app.state にキャッシュする。
+
+    uvicorn を複数ワーカーで起動した場合はワーカーごとに呼ばれる。エクスポートはロックファイルで
+    1 回に限られるので、各ワーカーは同じファイルから同じモデルを読み込む。
+    """
+
+    logger.info(
+        "Loading YOLO model path=%s precision=%s instances=%d pid=%d",
+        MODEL_PATH,
+        PRECISION,
+        GPU_CONCURRENCY,
+        os.getpid(),
+    )
+    model_pool: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+    for _ in range(GPU_CONCURRENCY):
+        model = load_model(MODEL_PATH, **model_load_options())
+        model_pool.put(model)
+    app.state.model_pool = model_pool
+    # クラス ID → 描画色の対応表はモデルのクラス数から一度だけ作る
+    app.state.class_colors = build_class_colors(len(model.names))
+
+
+@app.on_event("startup")
+async def _configure_executor() -> None:
+    """`run_blocking` が使う既定の ThreadPoolExecutor をワーカー数付きで差し替える。"""
+
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS, thread_name_prefix="yolo"))
+
+
+@app.on_event("startup")
+async def _start_batcher() -> None:
+    """同時実行数を YOLO_GPU_CONCURRENCY に抑えつつ同時リクエストを束ねる MicroBatcher を起動する。"""
+
+    app.state.batcher = MicroBatcher(
+        predict_batch,
+        max_batch_size=MAX_BATCH_SIZE,
+        max_wait_ms=MAX_BATCH_WAIT_MS,
+        max_queue_size=BATCH_QUEUE_SIZE,
+        max_concurrency=GPU_CONCURRENCY,
+    )
+    app.state.batcher.start()
 
-    app.state.model = load_model(MODEL_PATH)
+
+@app.on_event("shutdown")
+async def _stop_batcher() -> None:
+    """シャットダウン時にバッチ処理タスクを止め、待機中のリクエストを終了させる。"""
+
+    batcher: Optional[MicroBatcher] = getattr(app.state, "batcher", None)
+    if batcher is not None:
+        await batcher.stop()
 
 
 @app.get("/healthz", include_in_schema=False)
-def healthcheck() -> JSONResponse:
+def healthcheck() -> Dict[str, str]:
     """ヘルスチェック用の軽量エンドポイント。"""
 
-    return JSONResponse({"status": "ok"})
+    return {"status": "ok"}
 
 
-@app.post("/detect", response_model=DetectionResponse)
+WAIT_ANNOTATE_DESCRIPTION = (
+    "If false, respond right after inference with an annotation_id and render the annotated image "
+    "in the background (fetch it from GET /detect/{annotation_id}/annotated)"
+)
+
+
+# response_model=None で再検証を省き、スキーマは OpenAPI 用に responses で宣言する
+@app.post(
+    "/detect",
+    response_model=None,
+    responses={200: {"model": DetectionResponse}},
+)
 async def detect_objects(
     request: Request,
+    background_tasks: BackgroundTasks,
     file: Optional[UploadFile] = File(None, description="Image file (JPEG/PNG)"),
+    annotate: bool = Query(True, description="Return the annotated image in image_with_boxes"),
+    wait_annotate: bool = Query(True, description=WAIT_ANNOTATE_DESCRIPTION),
     _: str = Depends(require_api_key),
-) -> DetectionResponse:
+) -> ORJSONResponse:
     """画像（multipart もしくは JSON）を受け取り、YOLO11m 推論結果と可視化画像を返す。"""
 
     # 1. 入力から画像バイトを取得
-    contents: Optional[bytes] = None
+    contents: Optional[BytesLike] = None
     original_source: str = "file"
     if file is not None:
         original_source = file.filename or "upload"
-        contents = await file.read()
+        contents = await read_upload(file)
         if not contents:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Empty file uploaded")
     else:
@@ -215,86 +546,117 @@ async def detect_objects(
             try:
                 raw_payload = await request.json()
                 payload = DetectionRequest(**raw_payload)
+            except HTTPException:
+                raise  # 本文サイズ超過 (413) はそのまま返す
             except Exception as exc:  # broad: validation or JSON error
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid JSON payload") from exc
 
             if not payload.images:
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="images array is required")
 
+            # 複数画像をまとめて推論したい場合は /detect_batch を使う
             first_image = payload.images[0]
             original_source = first_image.fileName or "json"
-            base64_data = first_image.base64.split(",", 1)[-1]
-            try:
-                contents = base64.b64decode(base64_data)
-            except (base64.binascii.Error, ValueError) as exc:
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid base64 payload") from exc
+            contents = await run_blocking(decode_image_payload, first_image)
         else:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="file or images payload required")
 
-    # 2. PIL へ変換してから YOLO11m で推論
+    # 2. OpenCV (BGR) へデコードしてから YOLO11m で推論
     assert contents is not None  # appease type checker; validated above
-    image = load_image_from_bytes(contents)
-    width, height = image.size
-    byte_length = len(contents)
-    logger.info(
-        "Received image source=%s size=%d bytes (~%.1f KB) resolution=%dx%d px",
-        original_source,
-        byte_length,
-        byte_length / 1024,
-        width,
-        height,
+    image_bgr, model_input, resize_info = await run_blocking(load_image_for_inference, contents, original_source)
+    # 同時に届いた他のリクエストとまとめて推論される
+    result = await app.state.batcher.submit(model_input)
+
+    # 3. 検出結果と可視化画像から JSON レスポンスを構築して返却（wait_annotate=false なら描画は後回し）
+    response, cls_ids = await run_blocking(
+        build_detection_response, result, image_bgr, resize_info, annotate and wait_annotate
     )
-    image, resize_info = prepare_image_for_inference(image)
-    final_width, final_height = resize_info["final_size"]
-    if resize_info["scaled"]:
-        logger.info(
-            "Prepared image for YOLO source=%s resolution=%dx%d px (original=%dx%d px, scale=%.3f, trigger=%s)",
-            original_source,
-            final_width,
-            final_height,
-            resize_info["original_size"][0],
-            resize_info["original_size"][1],
-            resize_info["scale"],
-            resize_info["trigger"],
-        )
-    else:
-        logger.info(
-            "Prepared image for YOLO source=%s resolution=%dx%d px (no resize)",
-            original_source,
-            final_width,
-            final_height,
+    if annotate and not wait_annotate:
+        defer_annotation(response, image_bgr, cls_ids, background_tasks)
+    log_response_summary(original_source, response)
+    return ORJSONResponse(response)
+
+
+@app.post(
+    "/detect_batch",
+    response_model=None,
+    responses={200: {"model": List[DetectionResponse]}},
+)
+async def detect_objects_batch(
+    payload: DetectionRequest,
+    background_tasks: BackgroundTasks,
+    annotate: bool = Query(True, description="Return the annotated image in image_with_boxes"),
+    wait_annotate: bool = Query(True, description=WAIT_ANNOTATE_DESCRIPTION),
+    _: str = Depends(require_api_key),
+) -> ORJSONResponse:
+    """JSON の複数画像をまとめて推論し、入力順にレスポンスを返す。"""
+
+    if not payload.images:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="images array is required")
+    if len(payload.images) > MAX_BATCH_IMAGES:
+        raise HTTPException(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            detail=f"Too many images: at most {MAX_BATCH_IMAGES} images per request",
         )
-    model = get_or_load_model(app.state, MODEL_PATH)
-    results = model.predict(
-        source=image,
-        conf=CONF_THRESHOLD,
-        iou=IOU_THRESHOLD,
-        verbose=False,
-    )
 
-    # 3. YOLO の出力（Boxes）を API 用のスキーマへマッピング
-    result = results[0]
-    detections: List[Detection] = []
-    counts: Dict[str, int] = {}
-
-    for box in result.boxes:
-        cls_id = int(box.cls)
-        label = result.names.get(cls_id, str(cls_id))
-        conf = float(box.conf)
-        xyxy = [float(v) for v in box.xyxy[0].tolist()]
-        detections.append(Detection(label=label, confidence=conf, box=xyxy))
-        counts[label] = counts.get(label, 0) + 1
-
-    # 4. OpenCV で枠線を描画し、Base64 へエンコード
-    image_np = np.array(image)
-    image_bgr = cv2.cvtColor(image_np, cv2.COLOR_RGB2BGR)
-    annotated = draw_detections(image_bgr, detections)
-
-    # 5. JSON レスポンスを構築して返却
-    response = DetectionResponse(
-        detections=detections,
-        counts=counts,
-        image_with_boxes=encode_image_to_data_uri(annotated),
+    # 1. 全画像をデコードしてから、まとめて MicroBatcher に積む（YOLO_MAX_BATCH_SIZE 枚ずつ推論）
+    sources = [item.fileName or f"json[{idx}]" for idx, item in enumerate(payload.images)]
+    prepared = await asyncio.gather(
+        *(
+            run_blocking(load_payload_for_inference, item, source)
+            for item, source in zip(payload.images, sources)
+        )
     )
-    log_response_summary(original_source, response)
-    return response
+    # 全画像を一度に積む（空きが足りなければ 1 枚も積まずに 503）
+    results = await app.state.batcher.submit_many([model_input for _, model_input, _ in prepared])
+
+    # 2. 結果は入力と同じ順序で返る
+    responses: List[Dict[str, Any]] = []
+    for source, result, (image_bgr, _, resize_info) in zip(sources, results, prepared):
+        response, cls_ids = await run_blocking(
+            build_detection_response, result, image_bgr, resize_info, annotate and wait_annotate
+        )
+        if annotate and not wait_annotate:
+            defer_annotation(response, image_bgr, cls_ids, background_tasks)
+        log_response_summary(source, response)
+        responses.append(response)
+    return ORJSONResponse(responses)
+
+
+@app.get(
+    "/detect/{annotation_id}/annotated",
+    response_class=Response,
+    responses={
+        200: {"content": {"image/jpeg": {}}, "description": "Annotated JPEG"},
+        202: {"description": "Not rendered yet; retry after Retry-After seconds"},
+        404: {"description": "Unknown or expired id"},
+        410: {"description": "Rendering failed"},
+    },
+)
+async def get_annotated_image(
+    annotation_id: str,
+    _: str = Depends(require_api_key),
+) -> Response:
+    """wait_annotate=false で後回しにした可視化画像（JPEG）を返す。
+
+    描画待ちは 202、描画失敗は 410、不明な ID・破棄済みは 404（202 以外はリトライ不要）。
+    """
+
+    annotation_status = annotation_store.status(annotation_id)
+    if annotation_status == "pending":
+        return ORJSONResponse(
+            {"detail": "Annotated image is not ready yet"},
+            status_code=status.HTTP_202_ACCEPTED,
+            headers={"Retry-After": "1"},
+        )
+    if annotation_status == "failed":
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="Annotated image rendering failed")
+
+    path = annotation_store.path_for(annotation_id)
+    try:
+        if path is None:
+            raise FileNotFoundError(annotation_id)
+        content = await run_blocking(path.read_bytes)
+    except FileNotFoundError as exc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Annotated image not found") from exc
+    return Response(content=content, media_type="image/jpeg")
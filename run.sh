@@ -0,0 +1,37 @@
+#!/usr/bin/env sh
+# 本番向け起動スクリプト
+#   WEB_CONCURRENCY : uvicorn ワーカー数（未指定なら GPU があれば 1、無ければ CPU コア数）。
+#                     ワーカーごとにモデルを VRAM へ載せるため、GPU 上のモデル数・同時推論数は
+#                     WEB_CONCURRENCY × YOLO_GPU_CONCURRENCY になる
+#   OMP_NUM_THREADS : ワーカーあたりの CPU 推論スレッド数（未指定なら CPU コア数 ÷ WEB_CONCURRENCY）。
+#                     各ワーカーがコア数分のスレッドを使うと CPU が過剰に取り合いになるため
+#   HOST / PORT     : 待ち受けアドレス（既定 0.0.0.0:8000）
+# ログは WEB_CONCURRENCY > 1 の場合 logs/server.<pid>.log にワーカーごとに出力される
+set -eu
+
+cd "$(dirname "$0")"
+
+# GNU nproc は OMP_NUM_THREADS を返すため、外して実際に使えるコア数を得る
+CPUS=$(env -u OMP_NUM_THREADS -u OMP_THREAD_LIMIT nproc)
+
+if [ -z "${WEB_CONCURRENCY:-}" ]; then
+    if command -v nvidia-smi >/dev/null 2>&1 && nvidia-smi -L >/dev/null 2>&1; then
+        WEB_CONCURRENCY=1
+    else
+        WEB_CONCURRENCY=$CPUS
+    fi
+fi
+export WEB_CONCURRENCY
+
+if [ -z "${OMP_NUM_THREADS:-}" ]; then
+    OMP_NUM_THREADS=$(( CPUS / WEB_CONCURRENCY ))
+    [ "$OMP_NUM_THREADS" -ge 1 ] || OMP_NUM_THREADS=1
+fi
+export OMP_NUM_THREADS
+
+exec uvicorn main:app \
+    --host "${HOST:-0.0.0.0}" \
+    --port "${PORT:-8000}" \
+    --workers "$WEB_CONCURRENCY" \
+    --loop uvloop \
+    --http httptools
@@ -0,0 +1,120 @@
+"""可視化画像 (JPEG) をレスポンス後に保存・取得するためのディスクキャッシュ。"""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+import re
+import time
+from typing import Literal, Optional, Union
+import uuid
+
+_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+# ready: 取得可能 / pending: 描画待ち / failed: 描画失敗 / missing: 不明な ID・破棄済み
+AnnotationStatus = Literal["ready", "pending", "failed", "missing"]
+
+
+class AnnotationStore:
+    """`annotation_id` をキーに JPEG をディレクトリへ保存し、古いものから間引く。
+
+    ディスク上に置くので、uvicorn の複数ワーカー間でも同じ ID で取得できる。
+    描画前は `<id>.pending`、描画失敗時は `<id>.failed` を置き、クライアントが状態を区別できるようにする。
+    `pending_timeout` 秒を過ぎた `.pending` は（プロセス終了などで描画されなかったとみなし）失敗扱い。
+    """
+
+    def __init__(self, directory: Path, max_entries: int = 256, pending_timeout: float = 60.0) -> None:
+        self.directory = directory
+        self.max_entries = max_entries
+        self.pending_timeout = pending_timeout
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def new_id() -> str:
+        """推測されにくいランダムな ID を払い出す。"""
+
+        return uuid.uuid4().hex
+
+    def path_for(self, annotation_id: str) -> Optional[Path]:
+        """保存済みの JPEG のパスを返す。ID が不正、または未生成・破棄済みなら None。"""
+
+        if not _ID_PATTERN.fullmatch(annotation_id):
+            return None
+        path = self.directory / f"{annotation_id}.jpg"
+        return path if path.exists() else None
+
+    def status(self, annotation_id: str) -> AnnotationStatus:
+        """可視化画像の状態を返す。"""
+
+        if not _ID_PATTERN.fullmatch(annotation_id):
+            return "missing"
+        # 保存・失敗記録は「結果を書いてから .pending を消す」順なので、.pending を先に見ておけば取りこぼさない
+        try:
+            pending_since: Optional[float] = self._marker(annotation_id, "pending").stat().st_mtime
+        except FileNotFoundError:
+            pending_since = None
+        if (self.directory / f"{annotation_id}.jpg").exists():
+            return "ready"
+        if self._marker(annotation_id, "failed").exists():
+            return "failed"
+        if pending_since is None:
+            return "missing"
+        if time.time() - pending_since > self.pending_timeout:
+            return "failed"
+        return "pending"
+
+    def mark_pending(self, annotation_id: str) -> None:
+        """描画待ちであることを記録する（ID を払い出した直後に呼ぶ）。"""
+
+        self._marker(annotation_id, "pending").touch()
+
+    def mark_failed(self, annotation_id: str) -> None:
+        """描画に失敗したことを記録する。"""
+
+        self._marker(annotation_id, "failed").touch()
+        self._remove(self._marker(annotation_id, "pending"))
+        self._prune()
+
+    def save(self, annotation_id: str, jpeg: Union[bytes, memoryview]) -> Path:
+        """JPEG を書き込み（途中の状態を読まれないよう一時ファイル経由）、上限を超えた分を削除する。"""
+
+        path = self.directory / f"{annotation_id}.jpg"
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(jpeg)
+        os.replace(tmp_path, path)
+        self._remove(self._marker(annotation_id, "pending"))
+        self._prune()
+        return path
+
+    def _marker(self, annotation_id: str, kind: str) -> Path:
+        return self.directory / f"{annotation_id}.{kind}"
+
+    @staticmethod
+    def _remove(path: Path) -> None:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def _prune(self) -> None:
+        now = time.time()
+        entries = []
+        for pattern in ("*.jpg", "*.failed", "*.pending"):
+            for entry in self.directory.glob(pattern):
+                try:
+                    mtime = entry.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if entry.suffix == ".pending":
+                    # 描画されないまま残った .pending だけを掃除する（描画待ちのものは件数に数えない）
+                    if now - mtime > self.pending_timeout:
+                        self._remove(entry)
+                    continue
+                entries.append((mtime, entry))
+        if self.max_entries <= 0:
+            return
+        entries.sort()
+        for _, entry in entries[: max(0, len(entries) - self.max_entries)]:
+            self._remove(entry)
+
+
+__all__ = ["AnnotationStatus", "AnnotationStore"]
@@ -0,0 +1,156 @@
+"""同時に届いた推論リクエストを 1 回の `model.predict` にまとめるマイクロバッチ処理。"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Callable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from fastapi import HTTPException, status
+
+PredictFn = Callable[[List[np.ndarray]], Sequence[Any]]
+
+
+class MicroBatcher:
+    """`asyncio.Queue` に積まれた画像を短い待ち時間で束ね、結果を Future で返す。"""
+
+    def __init__(
+        self,
+        predict: PredictFn,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        max_queue_size: int = 64,
+        max_concurrency: int = 1,
+    ) -> None:
+        self._predict = predict
+        self._max_batch_size = max(1, max_batch_size)
+        self._max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: asyncio.Queue[Tuple[np.ndarray, asyncio.Future]] = asyncio.Queue(maxsize=max(0, max_queue_size))
+        # 同時に実行する `predict` の数（GPU あたり 1〜2 程度）
+        self._slots = asyncio.Semaphore(max(1, max_concurrency))
+        self._inflight: Set[asyncio.Task] = set()
+        # キューから取り出したがまだ推論へ渡していない分（停止時に取りこぼさないよう保持する）
+        self._collecting: List[Tuple[np.ndarray, asyncio.Future]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """イベントループ上でバッチ処理用のバックグラウンドタスクを起動する。"""
+
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """バックグラウンドタスクを止め、待機中のリクエストを 503 で終了させる。"""
+
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+        pending = self._collecting
+        self._collecting = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(
+                    HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server is shutting down")
+                )
+
+    @property
+    def max_queue_size(self) -> int:
+        """キューに積める画像数の上限（0 は無制限）。"""
+
+        return self._queue.maxsize
+
+    async def submit(self, image: np.ndarray) -> Any:
+        """画像 1 枚をキューへ積み、対応する YOLO の Results を待つ。"""
+
+        return (await self.submit_many([image]))[0]
+
+    async def submit_many(self, images: Sequence[np.ndarray]) -> List[Any]:
+        """複数画像をまとめてキューへ積み、入力順の Results を待つ。
+
+        空きが足りない場合は 1 枚も積まずに 503 を返し、中途半端な推論を残さない。
+        """
+
+        if self._queue.maxsize > 0 and self._queue.maxsize - self._queue.qsize() < len(images):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Inference queue is full",
+            )
+
+        loop = asyncio.get_running_loop()
+        futures: List[asyncio.Future] = [loop.create_future() for _ in images]
+        for image, future in zip(images, futures):
+            self._queue.put_nowait((image, future))
+        try:
+            return list(await asyncio.gather(*futures))
+        except BaseException:
+            # 失敗・キャンセル時は残りを取り消し、バッチ処理側で推論されないようにする
+            for future in futures:
+                future.cancel()
+            raise
+
+    async def _collect(self) -> List[Tuple[np.ndarray, asyncio.Future]]:
+        """最初の 1 件を待ち、その後は `max_wait` 以内に届いた分を上限まで束ねる。"""
+
+        loop = asyncio.get_running_loop()
+        batch = self._collecting = [await self._queue.get()]
+        deadline = loop.time() + self._max_wait
+        while len(batch) < self._max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # 空きスロットを確保してから束ねるので、推論中に届いた分は次のバッチにまとまる
+            await self._slots.acquire()
+            try:
+                # クライアント切断などでキャンセル済みのリクエストは推論しない
+                batch = [(image, future) for image, future in await self._collect() if not future.done()]
+            except BaseException:
+                self._slots.release()
+                raise
+            self._collecting = []
+            if not batch:
+                self._slots.release()
+                continue
+
+            task = loop.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: List[Tuple[np.ndarray, asyncio.Future]]) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(None, self._predict, [image for image, _ in batch])
+        except Exception as exc:  # broad: 推論失敗はバッチ全体へ伝える
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        finally:
+            self._slots.release()
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+__all__ = ["MicroBatcher", "PredictFn"]
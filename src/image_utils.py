@@ -2,17 +2,25 @@
 from __future__ import annotations
 
 import base64
-import io
-from typing import Protocol, Sequence
+import binascii
+import struct
+from typing import Any, Dict, Mapping, Optional, Sequence, Tuple, TypedDict, Union
 
 import cv2
 import numpy as np
 from fastapi import HTTPException, status
-from PIL import Image, UnidentifiedImageError
 
+try:
+    # libbase64 の SIMD (SSSE3/AVX2) 実装。未導入の開発環境では標準ライブラリで代替する
+    import pybase64
+except ImportError:  # pragma: no cover
+    pybase64 = None
 
-class DetectionLike(Protocol):
-    """描画時に必要な属性だけを持つプロトコル。"""
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+class DetectionLike(TypedDict):
+    """描画時に必要なキーだけを持つ検出結果 dict。"""
 
     label: str
     confidence: float
@@ -29,48 +37,231 @@ COLORS = (
 )
 
 
-def load_image_from_bytes(data: bytes) -> Image.Image:
-    """アップロードバイト列を PIL Image (RGB) に変換。"""
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# SOF0〜SOF15 のうち DHT (C4) / JPG (C8) / DAC (CC) を除いたもの
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _jpeg_size(buf: memoryview) -> Optional[Tuple[int, int]]:
+    offset = 2
+    while offset + 9 <= len(buf):
+        if buf[offset] != 0xFF:
+            return None
+        marker = buf[offset + 1]
+        if marker == 0xFF:  # フィルバイト
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # 長さを持たないマーカー
+            offset += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack_from(">HH", buf, offset + 5)
+            return width, height
+        (length,) = struct.unpack_from(">H", buf, offset + 2)
+        offset += 2 + length
+    return None
+
+
+def read_image_size(data: BytesLike) -> Optional[Tuple[int, int]]:
+    """デコードせずにヘッダーから (幅, 高さ) を読む。JPEG / PNG / WebP / GIF / BMP 以外は None。"""
+
+    buf = memoryview(data).cast("B")
+    if len(buf) < 30:
+        return None
+    if buf[:8] == _PNG_SIGNATURE and buf[12:16] == b"IHDR":
+        return struct.unpack_from(">II", buf, 16)
+    if buf[:2] == b"\xff\xd8":
+        return _jpeg_size(buf)
+    if buf[:4] == b"RIFF" and buf[8:12] == b"WEBP":
+        chunk = bytes(buf[12:16])
+        if chunk == b"VP8 ":
+            width, height = struct.unpack_from("<HH", buf, 26)
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L":
+            (bits,) = struct.unpack_from("<I", buf, 21)
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            width = int.from_bytes(buf[24:27], "little") + 1
+            height = int.from_bytes(buf[27:30], "little") + 1
+            return width, height
+        return None
+    if buf[:6] in (b"GIF87a", b"GIF89a"):
+        return struct.unpack_from("<HH", buf, 6)
+    if buf[:2] == b"BM":
+        (header_size,) = struct.unpack_from("<I", buf, 14)
+        if header_size == 12:
+            return struct.unpack_from("<HH", buf, 18)
+        width, height = struct.unpack_from("<ii", buf, 18)
+        return abs(width), abs(height)
+    return None
+
+
+def load_image_from_bytes(data: BytesLike, max_pixels: int = 0) -> np.ndarray:
+    """アップロードバイト列を OpenCV (BGR, uint8) 画像へ直接デコード。
+
+    `max_pixels > 0` の場合はデコード前にヘッダーの解像度を確認し、超えていれば 413 を返す
+    （圧縮率の高い巨大画像でメモリを使い切らないため）。解像度を読めない形式は 415。
+    """
 
+    if max_pixels > 0:
+        size = read_image_size(data)
+        if size is None:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail="File is not a valid image",
+            )
+        if size[0] * size[1] > max_pixels:
+            raise HTTPException(
+                status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+                detail=f"Image dimensions too large: at most {max_pixels} pixels",
+            )
+
+    # PIL → NumPy → cvtColor の 3 段コピーを避け、imdecode で一度に BGR を得る
     try:
-        return Image.open(io.BytesIO(data)).convert("RGB")
-    except UnidentifiedImageError as exc:
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    except cv2.error:  # 空のバッファなどは例外になる
+        image = None
+    if image is None:
         raise HTTPException(
             status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
             detail="File is not a valid image",
-        ) from exc
+        )
+    return image
 
 
-def encode_image_to_data_uri(image: np.ndarray) -> str:
-    """OpenCV (BGR) 画像を JPEG Base64 の Data URI にする。"""
+def letterbox_image(image: np.ndarray, imgsz: int) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """BGR 画像を縦横比を保って imgsz x imgsz に収め、余白をグレー (114) で埋める。
+
+    戻り値の dict（`letterbox_scale` / `pad_left` / `pad_top`）は `unletterbox_boxes` で座標を戻すのに使う。
+    """
+
+    height, width = image.shape[:2]
+    scale = min(imgsz / width, imgsz / height)
+    new_size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    if new_size != (width, height):
+        image = cv2.resize(image, new_size, interpolation=cv2.INTER_LINEAR)
+
+    pad_w = imgsz - new_size[0]
+    pad_h = imgsz - new_size[1]
+    pad_left, pad_top = pad_w // 2, pad_h // 2
+    boxed = cv2.copyMakeBorder(
+        image,
+        pad_top,
+        pad_h - pad_top,
+        pad_left,
+        pad_w - pad_left,
+        cv2.BORDER_CONSTANT,
+        value=(114, 114, 114),
+    )
+    return boxed, {"letterbox_scale": scale, "pad_left": pad_left, "pad_top": pad_top}
+
+
+def unletterbox_boxes(xyxy: np.ndarray, info: Mapping[str, Any], shape: Sequence[int]) -> np.ndarray:
+    """レターボックス画像上の (N, 4) xyxy 座標を、`shape` (高さ, 幅, ...) の元画像の座標へ戻す。"""
+
+    height, width = shape[:2]
+    scale = info["letterbox_scale"]
+    boxes = np.array(xyxy, dtype=np.float32, copy=True).reshape(-1, 4)
+    boxes[:, [0, 2]] = np.clip((boxes[:, [0, 2]] - info["pad_left"]) / scale, 0, width)
+    boxes[:, [1, 3]] = np.clip((boxes[:, [1, 3]] - info["pad_top"]) / scale, 0, height)
+    return boxes
 
-    success, buffer = cv2.imencode(".jpg", image)
+
+def b64decode(data: BytesLike) -> bytes:
+    """Base64 をデコードする（pybase64 があればそちらを使う）。"""
+
+    if pybase64 is not None:
+        return pybase64.b64decode(data, validate=False)
+    return binascii.a2b_base64(data)
+
+
+def b64encode_to_str(data: BytesLike) -> str:
+    """バイト列を Base64 文字列へエンコードする（pybase64 があればそちらを使う）。"""
+
+    if pybase64 is not None:
+        return pybase64.b64encode_as_string(data)
+    return base64.b64encode(data).decode("ascii")
+
+
+def encode_image_to_jpeg(image: np.ndarray, quality: int = 82) -> memoryview:
+    """OpenCV (BGR) 画像を JPEG にエンコードし、出力バッファをコピーせず返す。"""
+
+    # 既定の品質 95 より小さくしてバイト数（= Base64 の処理量）を抑える。プログレッシブは無効のまま
+    params = [cv2.IMWRITE_JPEG_QUALITY, int(quality), cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+    success, buffer = cv2.imencode(".jpg", image, params)
     if not success:
         raise HTTPException(status_code=500, detail="Failed to encode result image")
-    payload = base64.b64encode(buffer).decode("utf-8")
+    return memoryview(buffer).cast("B")
+
+
+def encode_image_to_data_uri(image: np.ndarray, quality: int = 82) -> str:
+    """OpenCV (BGR) 画像を JPEG Base64 の Data URI にする。"""
+
+    # tobytes() の複製を作らず、imencode の出力バッファをそのまま Base64 へ渡す
+    payload = b64encode_to_str(encode_image_to_jpeg(image, quality))
     return f"data:image/jpeg;base64,{payload}"
 
 
-def draw_detections(image_bgr: np.ndarray, detections: Sequence[DetectionLike]) -> np.ndarray:
-    """YOLO 検出結果をもとにバウンディングボックスを描画。"""
+def build_class_colors(num_classes: int) -> np.ndarray:
+    """クラス ID → 描画色 (BGR) の対応表を作る。モデルロード時に一度だけ呼ぶ。"""
+
+    return np.array([COLORS[i % len(COLORS)] for i in range(max(1, num_classes))], dtype=np.uint8)
+
+
+def draw_detections_inplace(
+    image_bgr: np.ndarray,
+    detections: Sequence[DetectionLike],
+    cls_ids: np.ndarray,
+    class_colors: np.ndarray,
+) -> None:
+    """YOLO 検出結果のバウンディングボックスを、コピーせず画像へ直接描画する。
+
+    色は検出順ではなくクラスごとに `class_colors[cls_id]` で決まる。
+    """
+
+    if not detections:
+        return
+
+    boxes = np.array([det["box"] for det in detections], dtype=np.float32).astype(np.int32)
+    x1, y1, x2, y2 = boxes.T
+    corners = np.stack(
+        [np.stack(pt, axis=-1) for pt in ((x1, y1), (x2, y1), (x2, y2), (x1, y2))],
+        axis=1,
+    )
+    cls_ids = np.asarray(cls_ids) % len(class_colors)
+    colors = class_colors[cls_ids].tolist()
+
+    # 枠線はクラス（= 色）ごとに cv2.polylines 1 回でまとめて描く
+    for cls_id in np.unique(cls_ids).tolist():
+        color = tuple(class_colors[cls_id].tolist())
+        cv2.polylines(image_bgr, list(corners[cls_ids == cls_id]), True, color, 2, cv2.LINE_AA)
 
-    annotated = image_bgr.copy()
-    for idx, det in enumerate(detections):
-        x1, y1, x2, y2 = map(int, det.box)
-        color = COLORS[idx % len(COLORS)]
-        cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
-        label = f"{det.label} {det.confidence:.2f}"
+    # ラベル文字列は描画ループの前に作っておく
+    labels = [f"{det['label']} {det['confidence']:.2f}" for det in detections]
+    for (left, top), label, color in zip(boxes[:, :2].tolist(), labels, colors):
         cv2.putText(
-            annotated,
+            image_bgr,
             label,
-            (x1, max(y1 - 10, 0)),
+            (left, max(top - 10, 0)),
             cv2.FONT_HERSHEY_SIMPLEX,
             0.6,
-            color,
+            tuple(color),
             2,
             lineType=cv2.LINE_AA,
         )
-    return annotated
 
 
-__all__ = ["load_image_from_bytes", "encode_image_to_data_uri", "draw_detections", "DetectionLike"]
+__all__ = [
+    "b64decode",
+    "b64encode_to_str",
+    "build_class_colors",
+    "BytesLike",
+    "load_image_from_bytes",
+    "read_image_size",
+    "unletterbox_boxes",
+    "encode_image_to_data_uri",
+    "encode_image_to_jpeg",
+    "letterbox_image",
+    "draw_detections_inplace",
+    "DetectionLike",
+]
@@ -0,0 +1,64 @@
+"""ASGI レベルのリクエスト制限。"""
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Dict
+
+from fastapi import HTTPException, status
+from starlette.responses import JSONResponse
+
+Scope = Dict[str, Any]
+Message = Dict[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+PAYLOAD_TOO_LARGE_DETAIL = "Request body too large"
+
+
+class BodySizeLimitMiddleware:
+    """`Content-Length` が上限を超えるリクエストを本文を読む前に 413 で拒否する。
+
+    `Content-Length` の無いチャンク転送も受信量を数え、上限を超えた時点で 413 を送出する。
+    """
+
+    def __init__(self, app: ASGIApp, max_body_size: int) -> None:
+        self.app = app
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or self.max_body_size <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None:
+            try:
+                too_large = int(content_length) > self.max_body_size
+            except ValueError:
+                too_large = False
+            if too_large:
+                response = JSONResponse(
+                    {"detail": PAYLOAD_TOO_LARGE_DETAIL},
+                    status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+                )
+                await response(scope, receive, send)
+                return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+                        detail=PAYLOAD_TOO_LARGE_DETAIL,
+                    )
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+__all__ = ["BodySizeLimitMiddleware", "PAYLOAD_TOO_LARGE_DETAIL"]
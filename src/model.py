@@ -1,28 +1,154 @@
 """YOLO モデルのロードとキャッシュ制御。"""
 from __future__ import annotations
 
+from contextlib import contextmanager
+import logging
+import os
 from pathlib import Path
-from typing import Any
+import shutil
+import time
+from typing import Any, Dict, Iterator
 
+import torch
 from ultralytics import YOLO
 
+logger = logging.getLogger("yolo-fastapi")
 
-def load_model(model_path: Path) -> YOLO:
-    """ディスクから YOLO ウェイトを読み込み、YOLO インスタンスを返す。"""
+# `YOLO_PRECISION` で選べる推論精度
+PRECISIONS = ("fp32", "fp16", "int8")
 
-    if not model_path.exists():
-        raise RuntimeError(f"Model not found at {model_path}")
-    return YOLO(model_path.as_posix())
+
+def resolve_precision(precision: str) -> str:
+    """指定された推論精度を検証し、実行環境で使えない場合は fp32 に落とす。"""
+
+    value = precision.strip().lower()
+    if value not in PRECISIONS:
+        raise RuntimeError(f"Unsupported precision {precision!r} (expected one of {', '.join(PRECISIONS)})")
+    if value == "fp16" and not torch.cuda.is_available():
+        logger.warning("fp16 inference requires a CUDA GPU; falling back to fp32")
+        return "fp32"
+    return value
+
+
+def predict_options(precision: str) -> Dict[str, Any]:
+    """精度に応じて `model.predict` へ追加で渡す引数を返す。"""
+
+    if precision == "fp16":
+        # Tensor Core を使うため GPU 0 で半精度推論
+        return {"half": True, "device": 0}
+    return {}
+
+
+@contextmanager
+def _export_lock(target: Path, timeout: float = 3600.0) -> Iterator[None]:
+    """`<target>.lock` を排他作成し、複数ワーカーが同じエクスポートを重複実行しないようにする。"""
+
+    lock_path = target.with_name(f"{target.name}.lock")
+    while True:
+        try:
+            fd = os.open(lock_path.as_posix(), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            # 異常終了したプロセスが残したロックは timeout 経過後に破棄する
+            try:
+                if time.time() - lock_path.stat().st_mtime > timeout:
+                    lock_path.unlink()
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(1.0)
+    os.close(fd)
+    try:
+        yield
+    finally:
+        try:
+            lock_path.unlink()
+        except FileNotFoundError:
+            pass
 
 
-def get_or_load_model(state: Any, model_path: Path) -> YOLO:
-    """FastAPI の `app.state` を使って単一インスタンスを共有する。"""
+def _export_once(model_path: Path, target: Path, **export_args: Any) -> Path:
+    """`target` が無ければロックを取ってエクスポートし、生成物を `target` へ配置する。"""
 
-    model = getattr(state, "model", None)
-    if model is None:
-        model = load_model(model_path)
-        state.model = model
+    if target.exists():
+        return target
+    with _export_lock(target):
+        # ロック待ちの間に別ワーカーがエクスポートを終えていればそれを使う
+        if target.exists():
+            return target
+        logger.info("Exporting %s to %s (%s)", model_path.name, target.name, export_args)
+        exported = Path(YOLO(model_path.as_posix()).export(**export_args))
+        if exported.resolve() != target.resolve():
+            shutil.move(exported.as_posix(), target.as_posix())
+    return target
+
+
+def _load_tensorrt(model_path: Path, target: Path, precision: str, imgsz: int, batch: int) -> YOLO:
+    """GPU 向けに TensorRT エンジンを (初回のみ) `target` へ生成して読み込む。"""
+
+    engine_path = _export_once(
+        model_path,
+        target,
+        format="engine",
+        half=precision == "fp16",
+        imgsz=imgsz,
+        # マイクロバッチで 1〜batch 枚が流れるため、バッチ次元だけは可変にしておく
+        dynamic=batch > 1,
+        batch=batch,
+    )
+    model = YOLO(engine_path.as_posix(), task="detect")
+    # エンジンは固定解像度なので predict 側の imgsz も揃える
+    model.overrides["imgsz"] = imgsz
     return model
 
 
-__all__ = ["get_or_load_model", "load_model"]
+def load_model(
+    model_path: Path,
+    precision: str = "fp32",
+    calibration_data: str = "coco8.yaml",
+    tensorrt: bool = False,
+    imgsz: int = 640,
+    batch: int = 1,
+) -> YOLO:
+    """ディスクから YOLO ウェイトを読み込み、YOLO インスタンスを返す。
+
+    `precision="int8"` の場合は OpenVINO int8 へ、`tensorrt=True` かつ CUDA が使える場合は
+    TensorRT エンジンへエクスポート済みのモデルを読み込む。TensorRT が使えなければ `.pt` に戻り、
+    `<engine>.failed` を残して以降の起動では再試行しない。
+    """
+
+    if not model_path.exists():
+        raise RuntimeError(f"Model not found at {model_path}")
+    if precision == "int8":
+        target = model_path.with_name(f"{model_path.stem}_int8_{imgsz}_b{batch}_openvino_model")
+        openvino_path = _export_once(
+            model_path,
+            target,
+            format="openvino",
+            int8=True,
+            data=calibration_data,
+            imgsz=imgsz,
+            dynamic=batch > 1,
+            batch=batch,
+        )
+        model = YOLO(openvino_path.as_posix(), task="detect")
+        model.overrides["imgsz"] = imgsz
+        return model
+    if tensorrt and torch.cuda.is_available():
+        target = model_path.with_name(f"{model_path.stem}_{precision}_{imgsz}_b{batch}.engine")
+        # 失敗したエクスポートを起動・ワーカーごとに再試行しないよう、マーカーで記録しておく
+        failed_marker = target.with_name(f"{target.name}.failed")
+        if failed_marker.exists():
+            logger.warning(
+                "TensorRT export previously failed; using %s (remove %s to retry)", model_path.name, failed_marker
+            )
+        else:
+            try:
+                return _load_tensorrt(model_path, target, precision, imgsz, batch)
+            except Exception:  # broad: TensorRT 未導入やエクスポート失敗時は PyTorch で動かす
+                logger.warning("TensorRT export failed; falling back to %s", model_path.name, exc_info=True)
+                failed_marker.touch()
+    return YOLO(model_path.as_posix())
+
+
+__all__ = ["PRECISIONS", "load_model", "predict_options", "resolve_precision"]
@@ -0,0 +1,20 @@
+"""orjson でシリアライズする JSON レスポンス。"""
+from __future__ import annotations
+
+from typing import Any
+
+import orjson
+from starlette.responses import JSONResponse
+
+
+class ORJSONResponse(JSONResponse):
+    """`fastapi.responses.ORJSONResponse`（FastAPI 0.143 で非推奨）の代替。
+
+    numpy の配列・スカラーや非文字列キーの dict もそのままシリアライズする。
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+__all__ = ["ORJSONResponse"]
@@ -0,0 +1,8 @@
+"""pytest 設定。`src` をインポートできるようにリポジトリ直下をパスへ追加する。"""
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# test.py は起動中の API へリクエストを送る手動確認用スクリプトなので収集しない
+collect_ignore = ["test.py"]
@@ -0,0 +1,88 @@
+"""AnnotationStore の保存・取得・間引き。"""
+import os
+from pathlib import Path
+
+from src.annotation_store import AnnotationStore
+
+
+def test_save_and_path_for(tmp_path: Path) -> None:
+    store = AnnotationStore(tmp_path / "annotations")
+    annotation_id = store.new_id()
+
+    assert store.path_for(annotation_id) is None
+    saved = store.save(annotation_id, b"jpeg-bytes")
+
+    assert store.path_for(annotation_id) == saved
+    assert saved.read_bytes() == b"jpeg-bytes"
+    assert not list(saved.parent.glob("*.tmp"))
+
+
+def test_path_for_rejects_invalid_ids(tmp_path: Path) -> None:
+    store = AnnotationStore(tmp_path)
+    (tmp_path / "secret.jpg").write_bytes(b"x")
+
+    assert store.path_for("secret") is None
+    assert store.path_for("../" + "0" * 32) is None
+    assert store.path_for("A" * 32) is None
+
+
+def test_save_prunes_oldest_entries(tmp_path: Path) -> None:
+    store = AnnotationStore(tmp_path, max_entries=2)
+    ids = [store.new_id() for _ in range(3)]
+    # 3 件目の保存時に最も古い 1 件目が削除される
+    for offset, annotation_id in enumerate(ids):
+        path = store.save(annotation_id, b"x")
+        # mtime の分解能に依存しないよう、古い順になるよう明示的に設定する
+        os.utime(path, (1_000_000 + offset, 1_000_000 + offset))
+
+    assert store.path_for(ids[0]) is None
+    assert store.path_for(ids[1]) is not None
+    assert store.path_for(ids[2]) is not None
+
+
+def test_status_follows_pending_ready_and_failed(tmp_path: Path) -> None:
+    store = AnnotationStore(tmp_path)
+    ready_id, failed_id = store.new_id(), store.new_id()
+
+    assert store.status(ready_id) == "missing"
+    store.mark_pending(ready_id)
+    store.mark_pending(failed_id)
+    assert store.status(ready_id) == "pending"
+
+    store.save(ready_id, b"x")
+    store.mark_failed(failed_id)
+
+    assert store.status(ready_id) == "ready"
+    assert store.status(failed_id) == "failed"
+    assert store.path_for(failed_id) is None
+    assert not list(tmp_path.glob("*.pending"))
+
+
+def test_stale_pending_is_reported_as_failed_and_pruned(tmp_path: Path) -> None:
+    store = AnnotationStore(tmp_path, pending_timeout=60.0)
+    stale_id = store.new_id()
+    store.mark_pending(stale_id)
+    # 描画タスクが実行されないまま 60 秒を過ぎた状態
+    os.utime(tmp_path / f"{stale_id}.pending", (1_000_000, 1_000_000))
+
+    assert store.status(stale_id) == "failed"
+    store.save(store.new_id(), b"x")
+    assert store.status(stale_id) == "missing"
+
+
+def test_status_rejects_invalid_ids(tmp_path: Path) -> None:
+    store = AnnotationStore(tmp_path)
+    (tmp_path / "secret.pending").touch()
+
+    assert store.status("secret") == "missing"
+
+
+def test_failed_markers_count_towards_max_entries(tmp_path: Path) -> None:
+    store = AnnotationStore(tmp_path, max_entries=1)
+    failed_id, ready_id = store.new_id(), store.new_id()
+    store.mark_failed(failed_id)
+    os.utime(tmp_path / f"{failed_id}.failed", (1_000_000, 1_000_000))
+    store.save(ready_id, b"x")
+
+    assert store.status(failed_id) == "missing"
+    assert store.status(ready_id) == "ready"
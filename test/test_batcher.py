@@ -0,0 +1,153 @@
+"""MicroBatcher の結合・キュー溢れ・停止時の挙動。"""
+import asyncio
+import threading
+import time
+from typing import List
+
+from fastapi import HTTPException
+import numpy as np
+import pytest
+
+from src.batcher import MicroBatcher
+
+
+def _image(value: int) -> np.ndarray:
+    return np.full((1,), value, dtype=np.int64)
+
+
+class RecordingPredict:
+    """受け取ったバッチサイズを記録し、各画像の値をそのまま返す。"""
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.batch_sizes: List[int] = []
+
+    def __call__(self, images: List[np.ndarray]) -> List[int]:
+        self.batch_sizes.append(len(images))
+        time.sleep(self.delay)
+        return [int(image[0]) for image in images]
+
+
+def test_concurrent_submits_are_coalesced_in_order() -> None:
+    predict = RecordingPredict()
+
+    async def scenario() -> List[int]:
+        batcher = MicroBatcher(predict, max_batch_size=4, max_wait_ms=50)
+        batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.submit(_image(i)) for i in range(6)))
+        finally:
+            await batcher.stop()
+
+    assert asyncio.run(scenario()) == list(range(6))
+    assert predict.batch_sizes == [4, 2]
+
+
+def test_submit_many_returns_results_in_input_order() -> None:
+    predict = RecordingPredict()
+
+    async def scenario() -> List[int]:
+        batcher = MicroBatcher(predict, max_batch_size=3, max_wait_ms=10)
+        batcher.start()
+        try:
+            return await batcher.submit_many([_image(i) for i in range(7)])
+        finally:
+            await batcher.stop()
+
+    assert asyncio.run(scenario()) == list(range(7))
+    assert predict.batch_sizes == [3, 3, 1]
+
+
+def test_submit_raises_503_when_queue_is_full() -> None:
+    async def scenario() -> None:
+        # start() しないのでキューは消費されない
+        batcher = MicroBatcher(RecordingPredict(), max_queue_size=1)
+        first = asyncio.ensure_future(batcher.submit(_image(0)))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as excinfo:
+            await batcher.submit(_image(1))
+        assert excinfo.value.status_code == 503
+        first.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_submit_many_is_all_or_nothing_on_overflow() -> None:
+    predict = RecordingPredict()
+
+    async def scenario() -> None:
+        batcher = MicroBatcher(predict, max_batch_size=2, max_wait_ms=10, max_queue_size=3)
+        with pytest.raises(HTTPException) as excinfo:
+            await batcher.submit_many([_image(i) for i in range(4)])
+        assert excinfo.value.status_code == 503
+
+        # 溢れたリクエストの画像は 1 枚も積まれていない
+        batcher.start()
+        try:
+            assert await batcher.submit_many([_image(i) for i in range(3)]) == [0, 1, 2]
+        finally:
+            await batcher.stop()
+
+    asyncio.run(scenario())
+    assert sum(predict.batch_sizes) == 3
+
+
+def test_cancelled_requests_are_not_predicted() -> None:
+    predict = RecordingPredict()
+
+    async def scenario() -> None:
+        batcher = MicroBatcher(predict, max_batch_size=8, max_wait_ms=50)
+        batcher.start()
+        try:
+            cancelled = asyncio.ensure_future(batcher.submit_many([_image(i) for i in range(3)]))
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            assert await batcher.submit(_image(9)) == 9
+        finally:
+            await batcher.stop()
+
+    asyncio.run(scenario())
+    assert predict.batch_sizes == [1]
+
+
+def test_stop_fails_requests_waiting_in_collect_window() -> None:
+    async def scenario() -> None:
+        # 束ねる待ち時間中（_collect が取り出し済み）に停止する
+        batcher = MicroBatcher(RecordingPredict(), max_batch_size=8, max_wait_ms=5000)
+        batcher.start()
+        pending = asyncio.ensure_future(batcher.submit(_image(0)))
+        await asyncio.sleep(0.05)
+        await batcher.stop()
+        with pytest.raises(HTTPException) as excinfo:
+            await asyncio.wait_for(pending, timeout=1)
+        assert excinfo.value.status_code == 503
+
+    asyncio.run(scenario())
+
+
+def test_stop_fails_queued_requests_and_waits_for_inflight() -> None:
+    release = threading.Event()
+
+    def blocking_predict(images: List[np.ndarray]) -> List[int]:
+        release.wait(timeout=5)
+        return [int(image[0]) for image in images]
+
+    async def scenario() -> None:
+        batcher = MicroBatcher(blocking_predict, max_batch_size=1, max_wait_ms=0)
+        batcher.start()
+        running = asyncio.ensure_future(batcher.submit(_image(1)))
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(batcher.submit(_image(2)))
+        await asyncio.sleep(0.05)
+
+        stopping = asyncio.ensure_future(batcher.stop())
+        await asyncio.sleep(0.05)
+        release.set()
+        await stopping
+
+        assert await running == 1
+        with pytest.raises(HTTPException) as excinfo:
+            await queued
+        assert excinfo.value.status_code == 503
+
+    asyncio.run(scenario())
@@ -0,0 +1,119 @@
+"""画像のヘッダー解析・デコード時の解像度制限・レターボックス変換。"""
+import struct
+
+import cv2
+from fastapi import HTTPException
+import numpy as np
+import pytest
+
+from src.image_utils import letterbox_image, load_image_from_bytes, read_image_size, unletterbox_boxes
+
+
+def _encode(ext: str, width: int, height: int, *params: int) -> bytes:
+    ok, buffer = cv2.imencode(ext, np.zeros((height, width, 3), dtype=np.uint8), list(params))
+    assert ok
+    return buffer.tobytes()
+
+
+@pytest.mark.parametrize(
+    "ext, params",
+    [
+        (".png", ()),
+        (".jpg", ()),
+        (".jpg", (cv2.IMWRITE_JPEG_PROGRESSIVE, 1)),
+        (".bmp", ()),
+        (".webp", (cv2.IMWRITE_WEBP_QUALITY, 80)),  # VP8 (非可逆)
+        (".webp", (cv2.IMWRITE_WEBP_QUALITY, 101)),  # VP8L (可逆)
+    ],
+)
+def test_read_image_size_from_header(ext: str, params: tuple) -> None:
+    assert read_image_size(_encode(ext, 123, 45, *params)) == (123, 45)
+
+
+def test_read_image_size_webp_extended() -> None:
+    # アルファ付きの非可逆 WebP は VP8X チャンクになる
+    ok, buffer = cv2.imencode(".webp", np.zeros((45, 123, 4), dtype=np.uint8), [cv2.IMWRITE_WEBP_QUALITY, 80])
+    assert ok
+    data = buffer.tobytes()
+
+    assert data[12:16] == b"VP8X"
+    assert read_image_size(data) == (123, 45)
+
+
+def test_read_image_size_gif_and_unknown() -> None:
+    gif = b"GIF89a" + struct.pack("<HH", 640, 480) + b"\x00" * 32
+
+    assert read_image_size(gif) == (640, 480)
+    assert read_image_size(b"not an image" * 4) is None
+    assert read_image_size(b"") is None
+
+
+def test_load_image_accepts_memoryview_within_limit() -> None:
+    data = memoryview(bytearray(_encode(".png", 40, 30)))
+
+    assert load_image_from_bytes(data, max_pixels=40 * 30).shape == (30, 40, 3)
+
+
+def test_load_image_rejects_too_many_pixels_before_decoding() -> None:
+    # 圧縮率の高い PNG: 数 KB でも展開すると大きい
+    data = _encode(".png", 4000, 3000)
+
+    with pytest.raises(HTTPException) as excinfo:
+        load_image_from_bytes(data, max_pixels=1_000_000)
+    assert excinfo.value.status_code == 413
+
+
+@pytest.mark.parametrize("data", [b"", b"\x89PNG\r\n\x1a\n" + b"\x00" * 8, b"plain text" * 10])
+def test_load_image_rejects_invalid_data(data: bytes) -> None:
+    with pytest.raises(HTTPException) as excinfo:
+        load_image_from_bytes(data, max_pixels=1_000_000)
+    assert excinfo.value.status_code == 415
+
+
+@pytest.mark.parametrize(
+    "width, height",
+    [
+        (480, 1280),  # 縦長（左右に余白）
+        (1920, 1080),  # 横長（上下に余白）
+        (200, 120),  # imgsz より小さい画像は拡大される
+        (333, 333),  # 正方形（余白なし）
+    ],
+)
+def test_letterbox_round_trip(width: int, height: int) -> None:
+    imgsz = 640
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    rect = (width // 5, height // 4, width * 3 // 5, height * 2 // 3)
+    cv2.rectangle(image, rect[:2], (rect[2] - 1, rect[3] - 1), (255, 255, 255), thickness=-1)
+
+    boxed, info = letterbox_image(image, imgsz)
+
+    assert boxed.shape == (imgsz, imgsz, 3)
+    # 長辺側には余白が付かず、短辺側だけが中央寄せで埋められる
+    assert min(info["pad_left"], info["pad_top"]) == 0
+    ys, xs = np.nonzero(boxed[:, :, 0] > 200)
+    detected = np.array([[xs.min(), ys.min(), xs.max() + 1, ys.max() + 1]], dtype=np.float32)
+
+    restored = unletterbox_boxes(detected, info, image.shape)
+
+    tolerance = max(1.0, 1.0 / info["letterbox_scale"]) + 1.0
+    np.testing.assert_allclose(restored[0], rect, atol=tolerance)
+
+
+def test_unletterbox_clips_boxes_to_image() -> None:
+    image = np.zeros((1280, 480, 3), dtype=np.uint8)
+    _, info = letterbox_image(image, 640)
+    # 左右の余白にはみ出したボックス
+    boxes = np.array([[0.0, -10.0, 640.0, 700.0]], dtype=np.float32)
+
+    restored = unletterbox_boxes(boxes, info, image.shape)
+
+    np.testing.assert_allclose(restored[0], [0, 0, 480, 1280])
+
+
+def test_unletterbox_does_not_modify_input() -> None:
+    _, info = letterbox_image(np.zeros((100, 200, 3), dtype=np.uint8), 640)
+    boxes = np.array([[160.0, 240.0, 320.0, 400.0]], dtype=np.float32)
+
+    unletterbox_boxes(boxes, info, (100, 200, 3))
+
+    np.testing.assert_array_equal(boxes, [[160.0, 240.0, 320.0, 400.0]])
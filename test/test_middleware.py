@@ -0,0 +1,47 @@
+"""BodySizeLimitMiddleware の 413 応答。"""
+from typing import Iterator
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from src.middleware import PAYLOAD_TOO_LARGE_DETAIL, BodySizeLimitMiddleware
+
+MAX_BODY_SIZE = 16
+
+
+def _client() -> TestClient:
+    app = FastAPI()
+    app.add_middleware(BodySizeLimitMiddleware, max_body_size=MAX_BODY_SIZE)
+
+    @app.post("/echo")
+    async def echo(request: Request) -> dict:
+        return {"size": len(await request.body())}
+
+    return TestClient(app)
+
+
+def _chunks(total: int) -> Iterator[bytes]:
+    for _ in range(total // 4):
+        yield b"abcd"
+
+
+def test_small_body_passes_through() -> None:
+    response = _client().post("/echo", content=b"x" * MAX_BODY_SIZE)
+
+    assert response.status_code == 200
+    assert response.json() == {"size": MAX_BODY_SIZE}
+
+
+def test_content_length_over_limit_is_rejected() -> None:
+    response = _client().post("/echo", content=b"x" * (MAX_BODY_SIZE + 1))
+
+    assert response.status_code == 413
+    assert response.json() == {"detail": PAYLOAD_TOO_LARGE_DETAIL}
+
+
+def test_chunked_body_over_limit_is_rejected() -> None:
+    # ジェネレーターを渡すと Content-Length 無しのチャンク転送になる
+    response = _client().post("/echo", content=_chunks(MAX_BODY_SIZE * 2))
+
+    assert response.status_code == 413
+    assert response.json() == {"detail": PAYLOAD_TOO_LARGE_DETAIL}